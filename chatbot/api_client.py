@@ -1,9 +1,9 @@
-import requests
 from config import FEATURES_ENDPOINT, PREDICT_ENDPOINT
+from http_client import CLIENT
 
 
-def get_required_features(timeout: int = 20):
-    r = requests.get(FEATURES_ENDPOINT, timeout=timeout)
+async def get_required_features(timeout: int = 20):
+    r = await CLIENT.get(FEATURES_ENDPOINT, timeout=timeout)
     r.raise_for_status()
     data = r.json()
 
@@ -14,8 +14,8 @@ def get_required_features(timeout: int = 20):
     return categorical, numerical, all_features
 
 
-def predict_price(features: dict, timeout: int = 30):
+async def predict_price(features: dict, timeout: int = 30):
     payload = {"features": features, "version": None}
-    r = requests.post(PREDICT_ENDPOINT, json=payload, timeout=timeout)
+    r = await CLIENT.post(PREDICT_ENDPOINT, json=payload, timeout=timeout)
     r.raise_for_status()
     return r.json()
@@ -1,9 +1,11 @@
+import asyncio
 import json
 import re
-import requests
-from typing import Dict, List, Any
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from config import OLLAMA_BASE_URL, OLLAMA_MODEL
+from config import OLLAMA_BASE_URL, OLLAMA_KEEP_ALIVE, OLLAMA_MODEL
+from http_client import CLIENT
 
 
 LOCKED_ALWAYS = {"NAME", "host name", "last review"}
@@ -22,23 +24,116 @@ NUMERIC_FIELDS = [
 
 BOOLEAN_FIELDS = {"instant_bookable", "host_identity_verified"}
 
+_TRUE = frozenset(("true", "t", "yes", "y", "1"))
+_FALSE = frozenset(("false", "f", "no", "n", "0"))
+
+SMART_NUMERIC_DEFAULTS = {
+    "minimum nights": 2.0,
+    "availability 365": 180.0,
+    "number of reviews": 20.0,
+    "reviews per month": 2.0,
+    "review rate number": 4.2,
+    "service fee": 20.0,
+    "calculated host listings count": 1.0,
+    "Construction year": 2015.0,
+    "lat": 0.0,
+    "long": 0.0,
+    "id": 0.0,
+    "host id": 0.0,
+}
+
+
+_RE_CODEFENCE = re.compile(r"```(?:json)?", re.IGNORECASE)
+_RE_JSON_OBJ = re.compile(r"\{.*\}", re.DOTALL)
+
+# (output key, label alternatives, value pattern). Labels that share a
+# prefix are listed longest first.
+_NUMERIC_LABELS = [
+    ("Construction year", r"construction year|year built", r"\d{4}"),
+    ("service fee", r"service fee", r"\d+(?:\.\d+)?"),
+    ("minimum nights", r"minimum nights|min nights", r"\d+(?:\.\d+)?"),
+    ("reviews per month", r"reviews per month", r"\d+(?:\.\d+)?"),
+    ("number of reviews", r"number of reviews|reviews", r"\d+(?:\.\d+)?"),
+    ("review rate number", r"review rate number|rating|review score", r"\d+(?:\.\d+)?"),
+    ("calculated host listings count", r"calculated host listings count|host listings", r"\d+(?:\.\d+)?"),
+    ("availability 365", r"availability\s*365|availability", r"\d+(?:\.\d+)?"),
+]
 
-def _ollama(prompt: str, timeout: int = 180) -> str:
+# One alternation scans the message once; the value group that matched
+# (v0, v1, ...) identifies the field.
+_ALL_NUMS = re.compile(
+    "|".join(
+        rf"(?:{label})\s*[:=]?\s*(?P<v{i}>{value})"
+        for i, (_, label, value) in enumerate(_NUMERIC_LABELS)
+    ),
+    re.IGNORECASE,
+)
+_NUM_GROUPS = {f"v{i}": key for i, (key, _, _) in enumerate(_NUMERIC_LABELS)}
+
+
+def _json_closed(fragment: str, state: List[int]) -> bool:
+    # state = [depth, in_string, escaped]; updated in place so the scan
+    # stays a single pass over the stream.
+    depth, in_string, escaped = state
+    closed = False
+    for ch in fragment:
+        if in_string:
+            if escaped:
+                escaped = 0
+            elif ch == "\\":
+                escaped = 1
+            elif ch == '"':
+                in_string = 0
+        elif ch == '"':
+            in_string = 1
+        elif ch == "{":
+            depth += 1
+        elif ch == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                closed = True
+                break
+    state[:] = [depth, in_string, escaped]
+    return closed
+
+
+async def _ollama(
+    prompt: str,
+    timeout: int = 180,
+    on_token: Optional[Callable[[str], None]] = None,
+) -> str:
     url = f"{OLLAMA_BASE_URL}/api/generate"
     payload = {
         "model": OLLAMA_MODEL,
         "prompt": prompt,
-        "stream": False,
-        "options": {"temperature": 0},
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {"temperature": 0, "num_predict": 256},
     }
-    r = requests.post(url, json=payload, timeout=timeout)
-    r.raise_for_status()
-    return r.json()["response"].strip()
+    buf = []
+    state = [0, 0, 0]
+    async with CLIENT.stream("POST", url, json=payload, timeout=timeout) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            token = chunk.get("response", "")
+            if token:
+                buf.append(token)
+                if on_token is not None:
+                    on_token(token)
+                # Stop reading as soon as the first JSON object is complete.
+                if _json_closed(token, state):
+                    break
+            if chunk.get("done"):
+                break
+    return "".join(buf).strip()
 
 
 def _extract_json(text: str) -> dict:
-    text = re.sub(r"```(?:json)?", "", text, flags=re.IGNORECASE).replace("```", "").strip()
-    match = re.search(r"\{.*\}", text, re.DOTALL)
+    text = _RE_CODEFENCE.sub("", text).replace("```", "").strip()
+    match = _RE_JSON_OBJ.search(text)
     if not match:
         raise ValueError(f"No JSON found:\n{text}")
     return json.loads(match.group(0))
@@ -49,74 +144,44 @@ def normalize_bool(v) -> str:
         return "True" if v else "False"
     if v is None:
         return "Unknown"
-    s = str(v).strip().lower()
-    if s in {"true", "t", "yes", "y", "1"}:
+    s = v if v.__class__ is str else str(v)
+    # Already-normalised values skip the strip/lower allocations
+    if s in _TRUE:
+        return "True"
+    if s in _FALSE:
+        return "False"
+    s = s.strip().lower()
+    if s in _TRUE:
         return "True"
-    if s in {"false", "f", "no", "n", "0"}:
+    if s in _FALSE:
         return "False"
     return "Unknown"
 
 
-def parse_number(text: str, pattern: str):
-    m = re.search(pattern, text, flags=re.IGNORECASE)
-    if not m:
-        return None
-    try:
-        return float(m.group(1))
-    except Exception:
-        return None
-
-
 def hard_parse_numerics(user_text: str) -> Dict[str, float]:
     t = user_text.lower()
 
     out = {}
 
-    val = parse_number(t, r"(?:construction year|year built)\s*[:=]?\s*(\d{4})")
-    if val:
-        out["Construction year"] = float(val)
-
-    val = parse_number(t, r"(?:service fee)\s*[:=]?\s*(\d+(\.\d+)?)")
-    if val is not None:
-        out["service fee"] = float(val)
-
-    val = parse_number(t, r"(?:minimum nights|min nights)\s*[:=]?\s*(\d+(\.\d+)?)")
-    if val is not None:
-        out["minimum nights"] = float(val)
-
-    val = parse_number(t, r"(?:number of reviews|reviews)\s*[:=]?\s*(\d+(\.\d+)?)")
-    if val is not None:
-        out["number of reviews"] = float(val)
-
-    val = parse_number(t, r"(?:reviews per month)\s*[:=]?\s*(\d+(\.\d+)?)")
-    if val is not None:
-        out["reviews per month"] = float(val)
-
-    val = parse_number(t, r"(?:review rate number|rating|review score)\s*[:=]?\s*(\d+(\.\d+)?)")
-    if val is not None:
-        out["review rate number"] = float(val)
-
-    val = parse_number(t, r"(?:calculated host listings count|host listings)\s*[:=]?\s*(\d+(\.\d+)?)")
-    if val is not None:
-        out["calculated host listings count"] = float(val)
-
-    val = parse_number(t, r"(?:availability\s*365|availability)\s*[:=]?\s*(\d+(\.\d+)?)")
-    if val is not None:
-        out["availability 365"] = float(val)
+    for m in _ALL_NUMS.finditer(t):
+        field = _NUM_GROUPS[m.lastgroup]
+        # Keep the first mention of each field
+        if field not in out:
+            out[field] = float(m.group(m.lastgroup))
 
     return out
 
 
-def llm_extract_categoricals(
-    user_text: str,
-    allowed_categoricals: List[str],
-) -> Dict[str, Any]:
-    prompt = f"""
+@lru_cache(maxsize=8)
+def _prompt_prefix(allowed_categoricals: Tuple[str, ...]) -> str:
+    # Identical leading tokens on every call let Ollama reuse its KV cache
+    # for the instructions and only prefill the user message.
+    return f"""
 You extract ONLY categorical Airbnb features from user text.
 
 Output ONLY one JSON object.
 Allowed keys:
-{allowed_categoricals}
+{list(allowed_categoricals)}
 
 Rules:
 - Only allowed keys.
@@ -131,12 +196,17 @@ Mapping:
 - Assume country is United States if not mentioned.
 
 User message:
-{user_text}
+""".lstrip()
+
 
-JSON:
-""".strip()
+async def llm_extract_categoricals(
+    user_text: str,
+    allowed_categoricals: List[str],
+    on_token: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    prompt = _prompt_prefix(tuple(allowed_categoricals)) + user_text + "\n\nJSON:"
 
-    raw = _ollama(prompt)
+    raw = await _ollama(prompt, on_token=on_token)
     extracted = _extract_json(raw)
 
     clean = {}
@@ -150,15 +220,22 @@ JSON:
     return clean
 
 
-def extract_features(
+async def extract_features(
     user_text: str,
     categorical_features: List[str],
     numerical_features: List[str],
+    on_token: Optional[Callable[[str], None]] = None,
 ) -> Dict:
     extracted = {}
 
-    extracted.update(hard_parse_numerics(user_text))
-    extracted.update(llm_extract_categoricals(user_text, categorical_features))
+    # The regex pass runs on a worker thread so the event loop can keep
+    # driving the LLM request meanwhile
+    numerics, categoricals = await asyncio.gather(
+        asyncio.to_thread(hard_parse_numerics, user_text),
+        llm_extract_categoricals(user_text, categorical_features, on_token),
+    )
+    extracted.update(numerics)
+    extracted.update(categoricals)
 
     extracted.pop("NAME", None)
     extracted.pop("host name", None)
@@ -167,46 +244,52 @@ def extract_features(
     return extracted
 
 
+_CAT_LOCKED, _CAT_BOOL, _CAT_STR = 0, 1, 2
+
+
+@lru_cache(maxsize=8)
+def _cat_plan(categorical_features: Tuple[str, ...]) -> Tuple[Tuple[str, int], ...]:
+    plan = []
+    for c in categorical_features:
+        if c in LOCKED_ALWAYS:
+            plan.append((c, _CAT_LOCKED))
+        elif c in BOOLEAN_FIELDS:
+            plan.append((c, _CAT_BOOL))
+        else:
+            plan.append((c, _CAT_STR))
+    return tuple(plan)
+
+
+@lru_cache(maxsize=8)
+def _num_plan(numerical_features: Tuple[str, ...]) -> Tuple[Tuple[str, float], ...]:
+    return tuple((n, SMART_NUMERIC_DEFAULTS.get(n, 0.0)) for n in numerical_features)
+
+
 def apply_defaults(
     features: Dict,
     categorical_features: List[str],
     numerical_features: List[str],
 ) -> Dict:
-    smart_numeric_defaults = {
-        "minimum nights": 2.0,
-        "availability 365": 180.0,
-        "number of reviews": 20.0,
-        "reviews per month": 2.0,
-        "review rate number": 4.2,
-        "service fee": 20.0,
-        "calculated host listings count": 1.0,
-        "Construction year": 2015.0,
-        "lat": 0.0,
-        "long": 0.0,
-        "id": 0.0,
-        "host id": 0.0,
-    }
-
     final = {}
 
-    for c in categorical_features:
-        if c in LOCKED_ALWAYS:
+    for c, kind in _cat_plan(tuple(categorical_features)):
+        if kind == _CAT_LOCKED:
             final[c] = "Unknown"
             continue
 
         val = features.get(c)
 
-        if c in BOOLEAN_FIELDS:
+        if kind == _CAT_BOOL:
             final[c] = normalize_bool(val)
         else:
             final[c] = "Unknown" if val is None or str(val).strip() == "" else str(val)
 
-    for n in numerical_features:
-        raw = features.get(n, smart_numeric_defaults.get(n, 0.0))
+    for n, default in _num_plan(tuple(numerical_features)):
+        raw = features.get(n, default)
         try:
             final[n] = float(raw)
         except Exception:
-            final[n] = float(smart_numeric_defaults.get(n, 0.0))
+            final[n] = default
 
     if "country" in final and final["country"] in {"Unknown", ""}:
         final["country"] = "United States"
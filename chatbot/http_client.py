@@ -0,0 +1,24 @@
+import asyncio
+import threading
+
+import httpx
+
+
+CLIENT = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+    timeout=30.0,
+)
+
+# Streamlit reruns the script on every interaction, so the client lives on
+# one long-lived loop instead of a fresh asyncio.run() loop per call.
+_LOOP = asyncio.new_event_loop()
+threading.Thread(target=_LOOP.run_forever, name="http-client", daemon=True).start()
+
+
+def submit(coro):
+    return asyncio.run_coroutine_threadsafe(coro, _LOOP)
+
+
+def run_sync(coro):
+    return submit(coro).result()
@@ -1,18 +1,34 @@
-import re
+import queue
+
 import streamlit as st
 
 from api_client import get_required_features, predict_price
 from extractor import extract_features, apply_defaults
+from http_client import run_sync, submit
 
 
-CRITICAL_FIELDS = [
+CRITICAL_FIELDS = (
     "room type",
     "minimum nights",
     "availability 365",
     "number of reviews",
     "review rate number",
     "service fee",
-]
+)
+
+REPLY_EXAMPLE = (
+    "`room type: Entire home/apt, minimum nights: 2, availability 365: 200, "
+    "number of reviews: 50, review rate number: 4.5, service fee: 25`"
+)
+
+NUMERIC_REPLY_KEYS = {
+    "minimum nights": "minimum nights",
+    "availability 365": "availability 365",
+    "number of reviews": "number of reviews",
+    "review rate number": "review rate number",
+    "service fee": "service fee",
+    "reviews per month": "reviews per month",
+}
 
 
 st.set_page_config(page_title="Airbnb Price Chatbot", page_icon="🏠", layout="centered")
@@ -34,8 +50,7 @@ def parse_kv_reply(text: str) -> dict:
     room type: Entire home/apt, minimum nights: 2, availability 365: 200
     """
     out = {}
-    parts = re.split(r",|\n", text)
-    for p in parts:
+    for p in text.replace("\n", ",").split(","):
         if ":" not in p:
             continue
         k, v = p.split(":", 1)
@@ -54,30 +69,59 @@ def parse_kv_reply(text: str) -> dict:
                 out["room type"] = val
             continue
 
-        numeric_map = {
-            "minimum nights": "minimum nights",
-            "availability 365": "availability 365",
-            "number of reviews": "number of reviews",
-            "review rate number": "review rate number",
-            "service fee": "service fee",
-            "reviews per month": "reviews per month",
-        }
-
-        if key in numeric_map:
+        if key in NUMERIC_REPLY_KEYS:
             try:
-                out[numeric_map[key]] = float(val)
+                out[NUMERIC_REPLY_KEYS[key]] = float(val)
             except Exception:
                 pass
 
     return out
 
 
+def stream_extraction(user_text: str) -> dict:
+    """
+    Runs extraction on the HTTP client loop and streams the LLM tokens
+    into the chat while it decodes.
+    """
+    tokens = queue.Queue()
+    future = submit(
+        extract_features(
+            user_text,
+            st.session_state.categorical,
+            st.session_state.numerical,
+            tokens.put,
+        )
+    )
+
+    def drain():
+        while not (future.done() and tokens.empty()):
+            try:
+                yield tokens.get(timeout=0.05)
+            except queue.Empty:
+                continue
+
+    st.write_stream(drain())
+    return future.result()
+
+
+def has_missing_critical(features: dict) -> bool:
+    for f in CRITICAL_FIELDS:
+        if f not in features:
+            return True
+    return False
+
+
 def missing_critical(features: dict):
     return [f for f in CRITICAL_FIELDS if f not in features]
 
 
+@st.cache_data(ttl=3600)
+def cached_required_features():
+    return run_sync(get_required_features())
+
+
 if not st.session_state.booted:
-    cat, num, allf = get_required_features()
+    cat, num, allf = cached_required_features()
     st.session_state.categorical = cat
     st.session_state.numerical = num
     st.session_state.all_features = allf
@@ -105,14 +149,13 @@ if user_msg:
                 followup = parse_kv_reply(user_msg)
                 merged = {**st.session_state.pending_features, **followup}
 
-                missing = missing_critical(merged)
-
-                if missing:
+                if has_missing_critical(merged):
+                    missing = missing_critical(merged)
                     reply = (
                         "I still need a few more details:\n\n"
                         + "\n".join([f"- **{m}**" for m in missing])
                         + "\n\nReply like:\n"
-                          "`room type: Entire home/apt, minimum nights: 2, availability 365: 200, number of reviews: 50, review rate number: 4.5, service fee: 25`"
+                        + REPLY_EXAMPLE
                     )
                     st.markdown(reply)
                     st.session_state.messages.append({"role": "assistant", "content": reply})
@@ -123,7 +166,7 @@ if user_msg:
                         st.session_state.categorical,
                         st.session_state.numerical,
                     )
-                    result = predict_price(final_features)
+                    result = run_sync(predict_price(final_features))
 
                     price = result.get("predicted_price")
                     currency = result.get("currency", "USD")
@@ -140,21 +183,16 @@ if user_msg:
 
             # ✅ CASE 2: Fresh message → extract normally
             else:
-                extracted = extract_features(
-                    user_msg,
-                    st.session_state.categorical,
-                    st.session_state.numerical,
-                )
-
-                missing = missing_critical(extracted)
+                extracted = stream_extraction(user_msg)
 
-                if missing:
+                if has_missing_critical(extracted):
+                    missing = missing_critical(extracted)
                     st.session_state.pending_features = extracted
                     reply = (
                         "I need a few more details to predict accurately:\n\n"
                         + "\n".join([f"- **{m}**" for m in missing])
                         + "\n\nReply with values like:\n"
-                          "`room type: Entire home/apt, minimum nights: 2, availability 365: 200, number of reviews: 50, review rate number: 4.5, service fee: 25`"
+                        + REPLY_EXAMPLE
                     )
                     st.markdown(reply)
                     st.session_state.messages.append({"role": "assistant", "content": reply})
@@ -164,7 +202,7 @@ if user_msg:
                         st.session_state.categorical,
                         st.session_state.numerical,
                     )
-                    result = predict_price(final_features)
+                    result = run_sync(predict_price(final_features))
 
                     price = result.get("predicted_price")
                     currency = result.get("currency", "USD")
@@ -1,34 +1,129 @@
+import asyncio
+import hashlib
 import logging
+import os
+import anyio
 import numpy as np
+import orjson
 from typing import Any, Dict, Optional
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from .predictor import PricePredictor
 
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="Airbnb Price Prediction API",
     description="API for predicting Airbnb listing prices",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
 predictor = None
 
-@app.on_event("startup")
-async def load_artifacts():
-    global predictor
+# Sync handlers run on Starlette's threadpool; raise its default cap of 40
+THREADPOOL_SIZE = 64
+
+# Concurrent /predict calls are coalesced into a single model.predict
+MAX_BATCH = 32
+BATCH_WINDOW_MS = 5
+
+_batch_queue = None
+_batcher = None
+_loader = None
+_load_error = None
+
+# /features never changes for a loaded model, so it is built once
+FEATURES_MAX_AGE = 3600
+_FEATURES_PAYLOAD = None
+_FEATURES_ETAG = None
+
+
+async def _run_batch(batch):
+    rows = []
+    pending = []
+    for features, future in batch:
+        missing = predictor.missing_features(features)
+        if missing:
+            if not future.done():
+                future.set_exception(ValueError(f"Missing required features: {set(missing)}"))
+            continue
+        rows.append(features)
+        pending.append(future)
+    if not rows:
+        return
+
     try:
-        predictor = PricePredictor()
-        feature_info = predictor.get_feature_info()
-        logger.info("✅ All artifacts loaded successfully")
-        logger.info(f"   Categorical features: {len(feature_info['categorical_features'])}")
-        logger.info(f"   Numerical features: {len(feature_info['numerical_features'])}")
-        logger.info(f"   Total features: {feature_info['total_features']}")
+        predictions = await anyio.to_thread.run_sync(predictor.predict, rows)
     except Exception as e:
-        logger.error(f"❌ Error loading artifacts: {e}")
-        raise
+        if len(rows) == 1:
+            if not pending[0].done():
+                pending[0].set_exception(e)
+            return
+        # One bad payload fails the whole batched call; retry row by row so
+        # the error only reaches the request that caused it
+        for features, future in zip(rows, pending):
+            await _run_batch([(features, future)])
+        return
+
+    for future, prediction in zip(pending, predictions):
+        if not future.done():
+            future.set_result(float(prediction))
+
+
+async def batcher_task():
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _batch_queue.get()]
+        deadline = loop.time() + BATCH_WINDOW_MS / 1000
+        while len(batch) < MAX_BATCH:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_batch_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        await _run_batch(batch)
+
+
+async def _load_predictor():
+    global predictor, _FEATURES_PAYLOAD, _FEATURES_ETAG, _load_error
+    try:
+        loaded = await anyio.to_thread.run_sync(PricePredictor)
+        feature_info = loaded.get_feature_info()
+        _FEATURES_PAYLOAD = {
+            "categorical_features": feature_info["categorical_features"],
+            "numerical_features": feature_info["numerical_features"],
+            "total_features": feature_info["total_features"],
+        }
+        digest = hashlib.sha1(orjson.dumps(_FEATURES_PAYLOAD, option=orjson.OPT_SORT_KEYS)).hexdigest()
+        _FEATURES_ETAG = f'"{digest}"'
+        # Published last so handlers never see a partially loaded predictor
+        predictor = loaded
+        logger.info(
+            "✅ Predictor ready: categorical=%d numerical=%d total=%s",
+            len(feature_info["categorical_features"]),
+            len(feature_info["numerical_features"]),
+            feature_info["total_features"],
+        )
+    except Exception as e:
+        # Kept for /health, which would otherwise report healthy forever
+        _load_error = e
+        logger.error("❌ Error loading artifacts: %s", e)
+
+
+@app.on_event("startup")
+async def load_artifacts():
+    global _batch_queue, _batcher, _loader
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    _batch_queue = asyncio.Queue()
+    _batcher = asyncio.create_task(batcher_task())
+    # Load off the event loop so /health answers (predictor_loaded=False)
+    # while the model is still being read
+    _loader = asyncio.create_task(_load_predictor())
 
 
 class PredictionRequest(BaseModel):
@@ -73,7 +168,6 @@ async def root():
         "endpoints": {
             "health": "/health",
             "predict": "/predict (POST)",
-            "predict_with_confidence": "/predict-with-confidence (POST)",
             "features": "/features",
             "docs": "/docs",
         },
@@ -82,6 +176,16 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    if _load_error is not None:
+        return ORJSONResponse(
+            {
+                "status": "error",
+                "predictor_loaded": False,
+                "artifacts_count": 0,
+                "error": f"Error loading artifacts: {_load_error}",
+            },
+            status_code=503,
+        )
     return {
         "status": "healthy",
         "predictor_loaded": predictor is not None,
@@ -90,47 +194,79 @@ async def health_check():
 
 
 @app.get("/features")
-async def get_features():
-    if predictor is None:
+async def get_features(request: Request):
+    if predictor is None or _FEATURES_PAYLOAD is None:
         raise HTTPException(status_code=503, detail="Predictor not loaded")
-    try:
-        feature_info = predictor.get_feature_info()
-        return {
-            "categorical_features": feature_info["categorical_features"],
-            "numerical_features": feature_info["numerical_features"],
-            "total_features": feature_info["total_features"],
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error getting feature info: {str(e)}")
+    headers = {
+        "ETag": _FEATURES_ETAG,
+        "Cache-Control": f"max-age={FEATURES_MAX_AGE}",
+    }
+    if request.headers.get("if-none-match") == _FEATURES_ETAG:
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(_FEATURES_PAYLOAD, headers=headers)
 
 
-@app.post("/predict", response_model=PredictionResponse)
-async def predict(request: PredictionRequest):
+# The body is decoded with orjson rather than validated into
+# PredictionRequest; the model is kept only for the OpenAPI schema.
+@app.post(
+    "/predict",
+    response_model=PredictionResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": PredictionRequest.model_json_schema()}},
+        }
+    },
+)
+async def predict(request: Request):
     if predictor is None:
         raise HTTPException(status_code=503, detail="Predictor not loaded")
     try:
-        prediction = predictor.predict(request.features)
-        return PredictionResponse(predicted_price=float(prediction[0]))
+        body = orjson.loads(await request.body())
+    except orjson.JSONDecodeError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid JSON body: {str(e)}")
+    features = body.get("features") if isinstance(body, dict) else None
+    if not isinstance(features, dict):
+        raise HTTPException(status_code=422, detail="Request body must contain a 'features' object")
+    try:
+        future = asyncio.get_running_loop().create_future()
+        await _batch_queue.put((features, future))
+        prediction = await future
+        return ORJSONResponse({"predicted_price": prediction, "currency": "USD"})
     except ValueError as e:
         raise HTTPException(
             status_code=400,
             detail=f"Feature validation error: {str(e)}. Use /features endpoint to see required features.",
         )
     except Exception as e:
-        logger.error(f"Prediction error: {e}")
+        logger.error("Prediction error: %s", e)
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
 
-@app.post("/predict-with-confidence", response_model=ConfidencePredictionResponse)
-async def predict_with_confidence(request: PredictionRequest):
+# Only forest models loaded from older versions support this; current HGB
+# models get a 501, so it is left out of the / listing and the docs
+@app.post(
+    "/predict-with-confidence",
+    response_model=ConfidencePredictionResponse,
+    include_in_schema=False,
+)
+def predict_with_confidence(request: PredictionRequest):
     if predictor is None:
         raise HTTPException(status_code=503, detail="Predictor not loaded")
     try:
+        # Per-tree spread is only defined for bagged forests; boosted
+        # models have no independent estimators to compare
+        model = predictor.model
+        if not hasattr(model, "estimators_"):
+            raise HTTPException(
+                status_code=501,
+                detail=f"Confidence estimates are not available for {type(model).__name__}",
+            )
+
         # Get preprocessed features
         X = predictor.preprocess(request.features)
 
         # Collect predictions from each tree in the forest
-        model = predictor.model
         all_preds = np.array([tree.predict(X) for tree in model.estimators_])
 
         mean_pred = float(np.mean(all_preds))
@@ -149,8 +285,10 @@ async def predict_with_confidence(request: PredictionRequest):
 
         if abstain:
             logger.warning(
-                f"High uncertainty prediction flagged (std={std_pred:.2f}). "
-                f"Returning abstain=True for features: {request.features}"
+                "High uncertainty prediction flagged (std=%.2f). "
+                "Returning abstain=True for features: %s",
+                std_pred,
+                request.features,
             )
 
         return ConfidencePredictionResponse(
@@ -160,13 +298,15 @@ async def predict_with_confidence(request: PredictionRequest):
             abstain=abstain,
         )
 
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(
             status_code=400,
             detail=f"Feature validation error: {str(e)}. Use /features endpoint to see required features.",
         )
     except Exception as e:
-        logger.error(f"Confidence prediction error: {e}")
+        logger.error("Confidence prediction error: %s", e)
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
 
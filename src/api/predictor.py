@@ -1,11 +1,9 @@
 import logging
-from pathlib import Path
-import sys
+import os
+import numpy as np
 import pandas as pd
-sys.path.append(str(Path(__file__).parent.parent.parent))
 from src.utils.artifact_manager import ArtifactManager
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class PricePredictor:
@@ -13,7 +11,7 @@ class PricePredictor:
         try:
             artifact_manager = ArtifactManager()
             if version:
-                logger.info(f"Loading artifacts for version {version}...")
+                logger.info("Loading artifacts for version %s...", version)
                 self.model, self.preprocessor, self.feature_info, self.metadata = (
                     artifact_manager.load_latest_artifacts()
                 )
@@ -22,51 +20,125 @@ class PricePredictor:
                 self.model, self.preprocessor, self.feature_info, self.metadata = (
                     artifact_manager.load_latest_artifacts()
                 )
-            logger.info("✅ All artifacts loaded successfully")
-            if self.metadata:
-                logger.info(f"   Model version: {self.metadata.get('version', 'unknown')}")
-                logger.info(f"   Model type: {self.metadata.get('model_type', 'unknown')}")
-                total_features = self.feature_info.get("total_features")
-                if total_features is None:
-                    total_features = len(self.feature_info.get("categorical_cols", [])) + len(
-                        self.feature_info.get("numerical_cols", [])
-                    )
-                logger.info(f"   Features: {total_features}")
+            self._cat_cols = list(self.feature_info["categorical_cols"])
+            self._num_cols = list(self.feature_info["numerical_cols"])
+            self._columns = self._cat_cols + self._num_cols
+            self._required = tuple(self._columns)
+            self._required_set = frozenset(self._required)
+            self._warned_extra = False
+            self.session = self._load_onnx(artifact_manager.latest_dir / "price_model.onnx")
+            self.compiled = None
+            if self.session is None:
+                self.compiled = self._load_compiled(artifact_manager.latest_dir / "price_model.so")
+            metadata = self.metadata or {}
+            logger.info(
+                "✅ Artifacts loaded: version=%s model_type=%s features=%s",
+                metadata.get("version", "unknown"),
+                metadata.get("model_type", "unknown"),
+                self.feature_info.get("total_features", len(self._columns)),
+            )
         except Exception as e:
-            logger.error(f"❌ Failed to load artifacts: {e}")
+            logger.error("❌ Failed to load artifacts: %s", e)
             raise
 
-    def _validate_features(self, df: pd.DataFrame) -> pd.DataFrame:
-        required_features = set(
-            self.feature_info["categorical_cols"] + self.feature_info["numerical_cols"]
+    @staticmethod
+    def _load_onnx(path):
+        """Returns an onnxruntime session for the fused pipeline, if available."""
+        if not path.exists():
+            return None
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            logger.info("onnxruntime not installed, using joblib model")
+            return None
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = os.cpu_count() or 1
+        session = ort.InferenceSession(
+            str(path), sess_options=options, providers=["CPUExecutionProvider"]
         )
-        input_features = set(df.columns)
-        missing_features = required_features - input_features
-        extra_features = input_features - required_features
+        logger.info("   Serving with ONNX Runtime")
+        return session
+
+    @staticmethod
+    def _load_compiled(path):
+        """Returns a tl2cgen predictor for the compiled forest, if available."""
+        if not path.exists():
+            return None
+        try:
+            import tl2cgen
+        except ImportError:
+            logger.info("tl2cgen not installed, using joblib model")
+            return None
+        compiled = tl2cgen.Predictor(str(path), nthread=1)
+        logger.info("   Serving with compiled tree ensemble")
+        return compiled
+
+    def _onnx_inputs(self, df: pd.DataFrame) -> dict:
+        inputs = {}
+        for c in self._cat_cols:
+            inputs[c] = df[c].astype(str).to_numpy().reshape(-1, 1)
+        for c in self._num_cols:
+            inputs[c] = df[c].to_numpy(dtype=np.float32).reshape(-1, 1)
+        return inputs
+
+    def missing_features(self, features: dict) -> list:
+        return [c for c in self._required if c not in features]
+
+    def _warn_extra(self, columns) -> None:
+        # Only the first request with unexpected keys is logged
+        if self._warned_extra:
+            return
+        extra = [c for c in columns if c not in self._required_set]
+        if extra:
+            logger.warning("Extra features will be ignored: %s", set(extra))
+            self._warned_extra = True
+
+    def _to_frame(self, rows: list) -> pd.DataFrame:
+        """Builds a validated, correctly ordered frame from feature dicts."""
+        for row in rows:
+            missing = self.missing_features(row)
+            if missing:
+                raise ValueError(f"Missing required features: {set(missing)}")
+            self._warn_extra(row)
+        # Column-wise construction in the fitted order skips the dtype
+        # inference and reordering a list-of-dicts DataFrame pays for.
+        return pd.DataFrame(
+            {c: [row[c] for row in rows] for c in self._columns},
+            columns=self._columns,
+        )
+
+    def _as_frame(self, features) -> pd.DataFrame:
+        if isinstance(features, dict):
+            return self._to_frame([features])
+        if isinstance(features, list):
+            return self._to_frame(features)
+        return self._validate_features(features)
+
+    def _validate_features(self, df: pd.DataFrame) -> pd.DataFrame:
+        missing_features = [c for c in self._required if c not in df.columns]
         if missing_features:
-            raise ValueError(f"Missing required features: {missing_features}")
-        if extra_features:
-            logger.warning(f"Extra features will be ignored: {extra_features}")
-        expected_order = self.feature_info["categorical_cols"] + self.feature_info["numerical_cols"]
-        return df[expected_order]
+            raise ValueError(f"Missing required features: {set(missing_features)}")
+        self._warn_extra(df.columns)
+        return df.reindex(columns=self._columns, copy=False)
 
     def preprocess(self, features):
         """Returns preprocessed feature array for tree-level inference."""
-        if isinstance(features, dict):
-            features = pd.DataFrame([features])
-        validated_features = self._validate_features(features)
-        return self.preprocessor.transform(validated_features)
+        return self.preprocessor.transform(self._as_frame(features))
 
     def predict(self, features):
         try:
-            if isinstance(features, dict):
-                features = pd.DataFrame([features])
-            validated_features = self._validate_features(features)
-            processed_features = self.preprocessor.transform(validated_features)
+            df = self._as_frame(features)
+            if self.session is not None:
+                return self.session.run(None, self._onnx_inputs(df))[0].ravel()
+            processed_features = self.preprocessor.transform(df)
+            if self.compiled is not None:
+                import tl2cgen
+
+                return self.compiled.predict(tl2cgen.DMatrix(processed_features)).ravel()
             prediction = self.model.predict(processed_features)
             return prediction
         except Exception as e:
-            logger.error(f"Prediction failed: {e}")
+            logger.error("Prediction failed: %s", e)
             raise
 
     def predict_single(self, **kwargs) -> float:
@@ -2,11 +2,12 @@ import logging
 import os
 
 import joblib
+import orjson
 
 from src.steps.evaluation import evaluate_model
 from src.steps.mlflow_tracking import log_experiment, setup_mlflow
-from src.steps.preprocessing import preprocess_data
-from src.steps.training import train_models
+from src.steps.preprocessing import load_sample, preprocess_data
+from src.steps.training import MODEL_PARAMS, search_models, train_models
 from src.utils.artifact_manager import ArtifactManager
 
 # Setup logging
@@ -14,7 +15,12 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def run_pipeline():
+def run_pipeline(param_grid=None):
+    """
+    param_grid: optional list of HistGradientBoostingRegressor params dicts.
+    With more than one entry they are compared in parallel and the best is
+    refitted on the full training set.
+    """
     print("🚀 Starting Airbnb MLOps Pipeline\n")
 
     # Setup MLflow
@@ -28,7 +34,18 @@ def run_pipeline():
     # Step 2: Train model
     print("\n🤖 Step 2: Starting model training...")
     print("   (This may take 2-5 minutes...)")
-    model, version = train_models(X_train, y_train, preprocessor, feature_info)
+    param_grid = param_grid or [MODEL_PARAMS]
+    model_params = param_grid[0]
+    if len(param_grid) > 1:
+        model_params = search_models(X_train, y_train, param_grid)
+    model, version = train_models(
+        X_train,
+        y_train,
+        preprocessor,
+        feature_info,
+        model_params=model_params,
+        sample=load_sample(),
+    )
 
     # Step 3: Evaluate model
     metrics = evaluate_model(model, X_test, y_test)
@@ -39,27 +56,21 @@ def run_pipeline():
         # Update the version with metrics
         version_dir = artifact_manager.versions_dir / version
         if version_dir.exists():
-            import json
-
             metadata_path = version_dir / "metadata.json"
-            with open(metadata_path, "r") as f:
-                metadata = json.load(f)
+            metadata = orjson.loads(metadata_path.read_bytes())
             metadata["metrics"] = metrics
-            with open(metadata_path, "w") as f:
-                json.dump(metadata, f, indent=4)
+            metadata_path.write_bytes(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
             print(f"   ✅ Updated version {version} with evaluation metrics")
     except Exception as e:
         logger.warning(f"Could not update version metadata: {e}")
 
     # Step 5: Log to MLflow
     params = {
-        "n_estimators": 100,
-        "random_state": 42,
-        "n_jobs": -1,
-        "model_type": "RandomForestRegressor",
+        **model_params,
+        "model_type": "HistGradientBoostingRegressor",
         "version": version,
     }
-    log_experiment(model, metrics, params)
+    upload = log_experiment(model, metrics, params)
 
     print("\n🎯 Pipeline completed successfully!")
     print("\n" + "=" * 50)
@@ -75,6 +86,9 @@ def run_pipeline():
     print("   4. Check artifacts/versions/ for model history")
     print("=" * 50)
 
+    # The model upload overlaps the summary above; result() re-raises any
+    # error from it
+    upload.result()
     return model, version, metrics
 
 
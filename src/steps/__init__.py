@@ -5,8 +5,7 @@ def compute_price_thresholds(prices):
     """
     Compute thresholds for price categorization.
     """
-    low = np.percentile(prices, 33)
-    high = np.percentile(prices, 66)
+    low, high = np.percentile(prices, [33, 66])
     return low, high
 
 
@@ -20,3 +19,13 @@ def assign_price_category(price, low, high):
         return "mid"
     else:
         return "luxury"
+
+
+PRICE_CATEGORIES = np.array(["cheap", "mid", "luxury"])
+
+
+def assign_price_categories(prices, low, high):
+    """
+    Vectorized assign_price_category over an array of prices.
+    """
+    return PRICE_CATEGORIES[np.searchsorted([low, high], prices, side="left")]
@@ -6,13 +6,19 @@ from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 
 METRICS_DIR = "artifacts"
 METRICS_PATH = os.path.join(METRICS_DIR, "metrics.json")
+PREDICT_BATCH_SIZE = 50_000
 
 
 def evaluate_model(model, X_test, y_test):
     print("\n📈 Step 3: Evaluating model...")
 
-    # Make predictions
-    y_pred = model.predict(X_test)
+    # Predict in batches to bound the model's per-call intermediates
+    n_test = X_test.shape[0]
+    y_pred = np.empty(n_test, dtype=np.float32)
+    for start in range(0, n_test, PREDICT_BATCH_SIZE):
+        stop = start + PREDICT_BATCH_SIZE
+        y_pred[start:stop] = model.predict(X_test[start:stop])
+    y_test = np.asarray(y_test, dtype=np.float32)
 
     # Calculate metrics
     mae = mean_absolute_error(y_test, y_pred)
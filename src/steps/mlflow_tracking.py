@@ -1,7 +1,11 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import mlflow
 import mlflow.sklearn
+from mlflow.entities import Metric, Param
+from mlflow.tracking import MlflowClient
 
 
 def setup_mlflow():
@@ -9,17 +13,37 @@ def setup_mlflow():
     mlflow.set_experiment("airbnb-price-prediction")
 
 
+def _log_model(run_id, model):
+    with mlflow.start_run(run_id=run_id):
+        mlflow.sklearn.log_model(model, "model")
+
+
 def log_experiment(model, metrics, params):
+    """
+    Log params and metrics in one batch and upload the model in the
+    background. Returns the upload future; call .result() before exiting so
+    upload errors reach the caller.
+    """
     print("\n📊 Step 4: Logging to MLflow...")
 
     with mlflow.start_run(
-        run_name=f"rf_model_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-    ):
-        mlflow.log_params(params)
-        mlflow.log_metrics(metrics)
-        mlflow.sklearn.log_model(model, "model")
-
-        print("   ✅ Experiment logged to MLflow")
-        print(
-            "   💡 Run 'mlflow ui --backend-store-uri sqlite:///mlflow.db' to view the dashboard"
+        run_name=f"hgb_model_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    ) as run:
+        run_id = run.info.run_id
+        timestamp = int(time.time() * 1000)
+        MlflowClient().log_batch(
+            run_id,
+            metrics=[Metric(k, float(v), timestamp, 0) for k, v in metrics.items()],
+            params=[Param(k, str(v)) for k, v in params.items()],
         )
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mlflow-log-model")
+    upload = executor.submit(_log_model, run_id, model)
+    # Lets the worker exit once the upload is done
+    executor.shutdown(wait=False)
+
+    print("   ✅ Experiment logged to MLflow")
+    print(
+        "   💡 Run 'mlflow ui --backend-store-uri sqlite:///mlflow.db' to view the dashboard"
+    )
+    return upload
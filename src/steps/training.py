@@ -1,24 +1,71 @@
 import logging
 import os
-import sys
-from pathlib import Path
 import joblib
 import mlflow
 import mlflow.sklearn
-from sklearn.ensemble import RandomForestRegressor
-sys.path.append(str(Path(__file__).parent.parent.parent))
-from src.utils.artifact_manager import ArtifactManager
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.model_selection import train_test_split
+from src.steps.preprocessing import RANDOM_STATE
+from src.utils.artifact_manager import DUMP_KWARGS, ArtifactManager
 
 logger = logging.getLogger(__name__)
 
-def train_models(X_train, y_train, preprocessor=None, feature_info=None, version=None):
-    print(f"   Training RandomForest with {len(y_train)} samples...")
+MODEL_PARAMS = {
+    "max_iter": 200,
+    "learning_rate": 0.05,
+    "max_bins": 255,
+    "early_stopping": True,
+    "random_state": 42,
+}
+
+
+def fit_model(X_train, y_train, model_params=None, verbose=0):
+    model = HistGradientBoostingRegressor(**(model_params or MODEL_PARAMS), verbose=verbose)
+    model.fit(X_train, y_train)
+    return model
+
+
+def search_models(X_train, y_train, param_grid, holdout_size=0.1):
+    """
+    Fit one model per params dict in parallel worker processes and return
+    the params with the best R² on a holdout carved from X_train, so every
+    candidate is ranked on the same rows and metric. joblib memory-maps the
+    fit split once for all workers instead of pickling it per task.
+    """
+    print(f"   Searching {len(param_grid)} configurations in parallel...")
+    X_fit, X_holdout, y_fit, y_holdout = train_test_split(
+        X_train, y_train, test_size=holdout_size, random_state=RANDOM_STATE
+    )
+    with joblib.parallel_backend("loky"):
+        scores = joblib.Parallel(n_jobs=len(param_grid))(
+            joblib.delayed(_holdout_score)(X_fit, y_fit, X_holdout, y_holdout, p)
+            for p in param_grid
+        )
+
+    best = max(range(len(param_grid)), key=scores.__getitem__)
+    print(f"   Best holdout R²: {scores[best]:.4f}")
+    return param_grid[best]
+
+
+def _holdout_score(X_fit, y_fit, X_holdout, y_holdout, model_params):
+    return fit_model(X_fit, y_fit, model_params).score(X_holdout, y_holdout)
+
+
+def train_models(
+    X_train,
+    y_train,
+    preprocessor=None,
+    feature_info=None,
+    version=None,
+    model_params=None,
+    sample=None,
+):
+    model_params = model_params or MODEL_PARAMS
+    print(f"   Training HistGradientBoosting with {len(y_train)} samples...")
 
     params = {
-        "n_estimators": 100,
-        "random_state": 42,
-        "n_jobs": -1,
-        "model_type": "RandomForestRegressor",
+        **model_params,
+        "model_type": "HistGradientBoostingRegressor",
     }
 
     mlflow.set_experiment("airbnb-price-prediction")
@@ -26,14 +73,11 @@ def train_models(X_train, y_train, preprocessor=None, feature_info=None, version
     with mlflow.start_run():
         mlflow.log_params(params)
 
-        model = RandomForestRegressor(
-            n_estimators=100, random_state=42, n_jobs=-1, verbose=1
-        )
-        model.fit(X_train, y_train)
+        model = fit_model(X_train, y_train, model_params, verbose=1)
 
         mlflow.log_metric("n_train_samples", len(y_train))
         mlflow.log_metric("n_features", X_train.shape[1])
-        mlflow.sklearn.log_model(model, "random_forest")
+        mlflow.sklearn.log_model(model, "hist_gradient_boosting")
 
         artifact_manager = ArtifactManager()
 
@@ -45,6 +89,7 @@ def train_models(X_train, y_train, preprocessor=None, feature_info=None, version
                 metrics={},
                 params=params,
                 version=version,
+                sample=sample,
             )
             print(f"   ✅ Model saved as version {saved_version}")
             mlflow.log_param("artifact_version", saved_version)
@@ -52,7 +97,7 @@ def train_models(X_train, y_train, preprocessor=None, feature_info=None, version
             MODEL_DIR = "artifacts"
             MODEL_PATH = os.path.join(MODEL_DIR, "price_model.pkl")
             os.makedirs(MODEL_DIR, exist_ok=True)
-            joblib.dump(model, MODEL_PATH)
+            joblib.dump(model, MODEL_PATH, **DUMP_KWARGS)
             print(f"   Saving model to {MODEL_PATH}...")
             saved_version = "legacy"
 
@@ -1,13 +1,25 @@
-import json
 import logging
 import os
+import re
 import shutil
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, Optional
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
+# LZ4 keeps (de)compression cheap
+DUMP_KWARGS = {"compress": ("lz4", 3)}
+
+# Only directories named like this under versions/ are treated as versions
+VERSION_RE = re.compile(r"^v\d+\.\d+\.\d+$")
+
+# Exported models (ONNX float32 graph, quantized compiled library) must match
+# sklearn's predictions to within this many price units on every sample row
+EXPORT_ATOL = 1.0
+
 
 class ArtifactManager:
     """Manages model versioning and artifact storage"""
@@ -17,25 +29,40 @@ class ArtifactManager:
         self.versions_dir = self.artifacts_dir / "versions"
         self.latest_dir = self.artifacts_dir / "latest"
         self.metadata_file = self.artifacts_dir / "metadata.json"
+        self._next_version = None
 
-        # Create directories
+        # Create directories; latest/ is a link created on first save
         self.versions_dir.mkdir(parents=True, exist_ok=True)
-        self.latest_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _version_key(name: str) -> tuple:
+        """Numeric sort key so v1.0.10 orders after v1.0.9"""
+        return tuple(map(int, name[1:].split(".")))
 
     def get_next_version(self) -> str:
         """Get next version number based on existing versions"""
-        if not self.versions_dir.exists():
-            return "v1.0.0"
+        if self._next_version is not None:
+            return self._next_version
 
-        existing_versions = [d.name for d in self.versions_dir.iterdir() if d.is_dir()]
-        if not existing_versions:
+        if not self.versions_dir.exists():
             return "v1.0.0"
 
-        # Sort versions and increment patch version
-        latest_version = sorted(existing_versions)[-1]
-        major, minor, patch = map(int, latest_version[1:].split("."))
+        # scandir reports is_dir() from the directory entry, without a stat per version
+        with os.scandir(self.versions_dir) as entries:
+            latest_version = max(
+                (e.name for e in entries if e.is_dir() and VERSION_RE.match(e.name)),
+                key=self._version_key,
+                default=None,
+            )
+        if latest_version is None:
+            self._next_version = "v1.0.0"
+            return self._next_version
+
+        # Increment patch version
+        major, minor, patch = self._version_key(latest_version)
         patch += 1
-        return f"v{major}.{minor}.{patch}"
+        self._next_version = f"v{major}.{minor}.{patch}"
+        return self._next_version
 
     def save_artifacts(
         self,
@@ -45,9 +72,12 @@ class ArtifactManager:
         metrics: Dict[str, float],
         params: Dict[str, Any],
         version: Optional[str] = None,
+        sample: Any = None,
     ) -> str:
         """
-        Save model artifacts with versioning
+        Save model artifacts with versioning. ``sample`` is a DataFrame of raw
+        feature rows; the ONNX and compiled exports are only kept if they
+        reproduce the sklearn predictions on it.
 
         Returns:
         --------
@@ -58,15 +88,20 @@ class ArtifactManager:
 
         version_dir = self.versions_dir / version
         version_dir.mkdir(exist_ok=True)
+        self._next_version = None
 
-        logger.info(f"Saving artifacts to version {version}")
+        logger.info("Saving artifacts to version %s", version)
 
         # Save artifacts to version directory
         import joblib
 
-        joblib.dump(model, version_dir / "price_model.pkl")
-        joblib.dump(preprocessor, version_dir / "preprocessor.pkl")
-        joblib.dump(feature_info, version_dir / "feature_names.pkl")
+        joblib.dump(model, version_dir / "price_model.pkl", **DUMP_KWARGS)
+        joblib.dump(preprocessor, version_dir / "preprocessor.pkl", **DUMP_KWARGS)
+        joblib.dump(feature_info, version_dir / "feature_names.pkl", **DUMP_KWARGS)
+        self._save_onnx(
+            model, preprocessor, feature_info, version_dir / "price_model.onnx", sample
+        )
+        self._save_compiled(model, preprocessor, version_dir / "price_model.so", sample)
 
         # Save metadata
         metadata = {
@@ -74,61 +109,223 @@ class ArtifactManager:
             "timestamp": datetime.now().isoformat(),
             "metrics": metrics,
             "params": params,
-            "model_type": "RandomForestRegressor",
+            "model_type": type(model).__name__,
             "feature_count": feature_info.get("total_features", 0),
         }
 
-        with open(version_dir / "metadata.json", "w") as f:
-            json.dump(metadata, f, indent=4)
+        (version_dir / "metadata.json").write_bytes(
+            orjson.dumps(metadata, option=orjson.OPT_INDENT_2)
+        )
 
-        # Update latest symlink
+        # Repoint latest/ at this version
         self._update_latest(version)
 
         # Update global metadata
         self._update_global_metadata(metadata)
 
-        logger.info(f"✅ Artifacts saved as version {version}")
+        logger.info("✅ Artifacts saved as version %s", version)
         return version
 
-    def _update_latest(self, version: str):
-        """Update latest symlink to point to new version"""
-        latest_model = self.latest_dir / "price_model.pkl"
-        latest_preprocessor = self.latest_dir / "preprocessor.pkl"
-        latest_features = self.latest_dir / "feature_names.pkl"
-        latest_metadata = self.latest_dir / "metadata.json"
+    def _save_onnx(
+        self,
+        model: Any,
+        preprocessor: Any,
+        feature_info: Dict[str, Any],
+        path: Path,
+        sample: Any = None,
+    ) -> bool:
+        """Export preprocessor + model as one ONNX graph for onnxruntime serving"""
+        # A reused version directory may hold an export from an earlier model;
+        # PricePredictor would prefer it over the new pickles, so it goes
+        # first and is only rewritten once the new graph passes validation
+        path.unlink(missing_ok=True)
+        if sample is None:
+            logger.info("No sample rows to validate against, skipping ONNX export")
+            return False
+        try:
+            import numpy as np
+            import onnxruntime as ort
+            from skl2onnx import convert_sklearn, update_registered_converter
+            from skl2onnx.common.data_types import FloatTensorType, StringTensorType
+            from sklearn.pipeline import Pipeline
+        except ImportError:
+            logger.info("skl2onnx/onnxruntime not installed, skipping ONNX export")
+            return False
+
+        from src.utils.transformers import MedianImputer
+
+        def median_imputer_shape(operator):
+            n_rows = operator.inputs[0].type.shape[0]
+            n_cols = len(operator.raw_operator.medians_)
+            operator.outputs[0].type = FloatTensorType([n_rows, n_cols])
+
+        def median_imputer_converter(scope, operator, container):
+            # Maps onto the ONNX-ML Imputer op, same as SimpleImputer
+            container.add_node(
+                "Imputer",
+                operator.inputs[0].full_name,
+                operator.outputs[0].full_name,
+                op_domain="ai.onnx.ml",
+                name=scope.get_unique_operator_name("MedianImputer"),
+                imputed_value_floats=operator.raw_operator.medians_.astype("float32").tolist(),
+                replaced_value_float=float("nan"),
+            )
+
+        update_registered_converter(
+            MedianImputer, "MedianImputer", median_imputer_shape, median_imputer_converter
+        )
+
+        # One input per raw column so the ColumnTransformer can select by name
+        initial_types = [
+            (c, StringTensorType([None, 1])) for c in feature_info["categorical_cols"]
+        ] + [(c, FloatTensorType([None, 1])) for c in feature_info["numerical_cols"]]
 
+        try:
+            pipeline = Pipeline([("pre", preprocessor), ("model", model)])
+            onnx_model = convert_sklearn(pipeline, initial_types=initial_types)
+        except Exception as e:
+            logger.warning("ONNX export failed, serving will use joblib model: %s", e)
+            return False
+
+        # Check the graph against sklearn before serving prefers it; inputs
+        # are built the same way PricePredictor builds them
+        serialized = onnx_model.SerializeToString()
+        try:
+            session = ort.InferenceSession(serialized, providers=["CPUExecutionProvider"])
+            inputs = {
+                c: sample[c].astype(str).to_numpy().reshape(-1, 1)
+                for c in feature_info["categorical_cols"]
+            }
+            inputs.update(
+                (c, sample[c].to_numpy(dtype=np.float32).reshape(-1, 1))
+                for c in feature_info["numerical_cols"]
+            )
+            onnx_pred = session.run(None, inputs)[0].ravel()
+            sklearn_pred = pipeline.predict(sample)
+        except Exception as e:
+            logger.warning("ONNX validation failed, serving will use joblib model: %s", e)
+            return False
+
+        max_diff = float(np.max(np.abs(onnx_pred - sklearn_pred), initial=0.0))
+        if not max_diff <= EXPORT_ATOL:
+            logger.warning(
+                "ONNX predictions differ from sklearn by up to %.4f, skipping ONNX export",
+                max_diff,
+            )
+            return False
+
+        with open(path, "wb") as f:
+            f.write(serialized)
+        return True
+
+    def _save_compiled(
+        self, model: Any, preprocessor: Any, path: Path, sample: Any = None
+    ) -> bool:
+        """Compile the tree ensemble to a native library with quantized thresholds"""
+        if sample is None:
+            logger.info("No sample rows to validate against, skipping compiled model export")
+            path.unlink(missing_ok=True)
+            return False
+        try:
+            import numpy as np
+            import tl2cgen
+            import treelite
+        except ImportError:
+            logger.info("treelite/tl2cgen not installed, skipping compiled model export")
+            path.unlink(missing_ok=True)
+            return False
+
+        try:
+            tl_model = treelite.sklearn.import_model(model)
+            tl2cgen.export_lib(
+                tl_model,
+                toolchain="gcc",
+                libpath=str(path),
+                params={"quantize": 1, "parallel_comp": os.cpu_count() or 1},
+            )
+            # Same check as the ONNX export: the quantized library must
+            # reproduce the sklearn model before serving prefers it
+            X = preprocessor.transform(sample)
+            compiled = tl2cgen.Predictor(str(path), nthread=1)
+            compiled_pred = compiled.predict(tl2cgen.DMatrix(X)).ravel()
+            sklearn_pred = model.predict(X)
+        except Exception as e:
+            logger.warning("Compiled model export failed, serving will use joblib model: %s", e)
+            path.unlink(missing_ok=True)
+            return False
+
+        max_diff = float(np.max(np.abs(compiled_pred - sklearn_pred), initial=0.0))
+        if not max_diff <= EXPORT_ATOL:
+            logger.warning(
+                "Compiled predictions differ from sklearn by up to %.4f, skipping compiled export",
+                max_diff,
+            )
+            path.unlink(missing_ok=True)
+            return False
+        return True
+
+    def _update_latest(self, version: str):
+        """Point latest/ at the new version directory"""
         version_dir = self.versions_dir / version
 
-        # Remove existing files
-        for file_path in [
-            latest_model,
-            latest_preprocessor,
-            latest_features,
-            latest_metadata,
-        ]:
-            if file_path.exists():
-                file_path.unlink()
-
-        # Create symlinks (or copy on Windows)
+        if os.name == "nt":
+            import _winapi
+
+            # Junctions need no privileges but cannot be swapped atomically
+            if self.latest_dir.exists():
+                self._remove_latest()
+            _winapi.CreateJunction(str(version_dir.resolve()), str(self.latest_dir))
+            return
+
+        # Build the new latest/ beside the old one and rename it into place so
+        # readers never see a half-updated latest/
+        tmp = self.artifacts_dir / "latest.tmp"
+        self._remove_path(tmp)
+        try:
+            # Relative target keeps the artifacts directory relocatable
+            tmp.symlink_to(Path(self.versions_dir.name) / version, target_is_directory=True)
+        except OSError:
+            # Filesystems without symlinks (some bind mounts, SMB shares)
+            # get a full copy instead
+            logger.info("Symlinks not supported, copying version into latest/")
+            shutil.copytree(version_dir, tmp)
+
+        old = None
+        if tmp.is_symlink() and (self.latest_dir.is_symlink() or not self.latest_dir.exists()):
+            # Link over link (or nothing) is a single atomic rename
+            os.replace(tmp, self.latest_dir)
+        else:
+            # A real directory cannot be renamed over; move the old one aside
+            # first so latest/ is only missing between two renames
+            if self.latest_dir.is_symlink() or self.latest_dir.exists():
+                old = self.artifacts_dir / "latest.old"
+                self._remove_path(old)
+                os.replace(self.latest_dir, old)
+            os.replace(tmp, self.latest_dir)
+        if old is not None:
+            self._remove_path(old)
+
+    @staticmethod
+    def _remove_path(path: Path):
+        """Remove a symlink or directory at path, if any"""
+        if path.is_symlink():
+            path.unlink()
+        elif path.exists():
+            shutil.rmtree(path)
+
+    def _remove_latest(self):
         try:
-            latest_model.symlink_to(version_dir / "price_model.pkl")
-            latest_preprocessor.symlink_to(version_dir / "preprocessor.pkl")
-            latest_features.symlink_to(version_dir / "feature_names.pkl")
-            latest_metadata.symlink_to(version_dir / "metadata.json")
+            # Removes a junction (or empty directory) without touching its target
+            os.rmdir(self.latest_dir)
         except OSError:
-            # Fallback to copy if symlinks not supported
-            shutil.copy2(version_dir / "price_model.pkl", latest_model)
-            shutil.copy2(version_dir / "preprocessor.pkl", latest_preprocessor)
-            shutil.copy2(version_dir / "feature_names.pkl", latest_features)
-            shutil.copy2(version_dir / "metadata.json", latest_metadata)
+            shutil.rmtree(self.latest_dir)
 
     def _update_global_metadata(self, new_metadata: Dict[str, Any]):
         """Update global metadata file"""
         global_metadata = {}
 
         if self.metadata_file.exists():
-            with open(self.metadata_file, "r") as f:
-                global_metadata = json.load(f)
+            global_metadata = orjson.loads(self.metadata_file.read_bytes())
 
         global_metadata["latest_version"] = new_metadata["version"]
         global_metadata["last_updated"] = new_metadata["timestamp"]
@@ -150,13 +347,12 @@ class ArtifactManager:
             for v in global_metadata["versions"]
             if v["version"] != new_metadata["version"]
         ]
-        # Add new version
-        global_metadata["versions"].append(version_info)
-        # Sort by timestamp
-        global_metadata["versions"].sort(key=lambda x: x["timestamp"], reverse=True)
+        # Newest first: prepending keeps the list ordered without a re-sort
+        global_metadata["versions"].insert(0, version_info)
 
-        with open(self.metadata_file, "w") as f:
-            json.dump(global_metadata, f, indent=4)
+        self.metadata_file.write_bytes(
+            orjson.dumps(global_metadata, option=orjson.OPT_INDENT_2)
+        )
 
     def load_latest_artifacts(self):
         """Load the latest version of artifacts"""
@@ -182,8 +378,7 @@ class ArtifactManager:
         metadata_path = self.latest_dir / "metadata.json"
         metadata = {}
         if metadata_path.exists():
-            with open(metadata_path, "r") as f:
-                metadata = json.load(f)
+            metadata = orjson.loads(metadata_path.read_bytes())
 
         return model, preprocessor, feature_info, metadata
 
@@ -197,21 +392,20 @@ class ArtifactManager:
         if not metadata_path.exists():
             raise FileNotFoundError(f"Metadata not found for version {version}")
 
-        with open(metadata_path, "r") as f:
-            return json.load(f)
+        return orjson.loads(metadata_path.read_bytes())
 
     def list_versions(self) -> list:
         """List all available versions"""
         if not self.versions_dir.exists():
             return []
 
+        version_dirs = [
+            d for d in self.versions_dir.iterdir() if d.is_dir() and VERSION_RE.match(d.name)
+        ]
         versions = []
-        for version_dir in sorted(self.versions_dir.iterdir()):
-            if version_dir.is_dir():
-                metadata_path = version_dir / "metadata.json"
-                if metadata_path.exists():
-                    with open(metadata_path, "r") as f:
-                        metadata = json.load(f)
-                    versions.append(metadata)
+        for version_dir in sorted(version_dirs, key=lambda d: self._version_key(d.name)):
+            metadata_path = version_dir / "metadata.json"
+            if metadata_path.exists():
+                versions.append(orjson.loads(metadata_path.read_bytes()))
 
         return versions
@@ -0,0 +1,29 @@
+import numpy as np
+from sklearn.base import BaseEstimator, OneToOneFeatureMixin, TransformerMixin
+
+
+def _as_float_array(X):
+    X = np.asarray(X)
+    if X.dtype.kind != "f":
+        X = X.astype(np.float64)
+    return X
+
+
+class MedianImputer(OneToOneFeatureMixin, TransformerMixin, BaseEstimator):
+    """
+    Median imputation fitted with one np.nanmedian over all columns.
+    Columns that are entirely missing are filled with 0 rather than dropped.
+    """
+
+    def fit(self, X, y=None):
+        if hasattr(X, "columns"):
+            self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        X = _as_float_array(X)
+        self.n_features_in_ = X.shape[1]
+        medians = np.nanmedian(X, axis=0) if X.shape[0] else np.full(X.shape[1], np.nan)
+        self.medians_ = np.where(np.isnan(medians), 0.0, medians)
+        return self
+
+    def transform(self, X):
+        X = _as_float_array(X)
+        return np.where(np.isnan(X), self.medians_.astype(X.dtype), X)